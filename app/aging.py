@@ -3,37 +3,53 @@
 
 from __future__ import annotations
 
+import sys
+from bisect import bisect_left
 from dataclasses import dataclass
 from datetime import datetime
-from decimal import Decimal
-from typing import Any, Dict, Iterable, List, Optional, Set
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from operator import itemgetter
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set
+
+import ijson
 
 
 BucketKey = str
 
 
+# interned so bucket-keyed dict lookups short-circuit on identity
 BUCKET_ORDER: List[BucketKey] = [
-    "current",
-    "1-20",
-    "21-30",
-    "31-45",
-    "46-60",
-    "61-90",
-    "91+",
+    sys.intern(bucket)
+    for bucket in (
+        "current",
+        "1-20",
+        "21-30",
+        "31-45",
+        "46-60",
+        "61-90",
+        "91+",
+    )
 ]
 
 BUCKET_ACTION: Dict[BucketKey, str] = {
-    "current": "No Action",
-    "1-20": "Accounting Outreach",
-    "21-30": "Accounting Outreach",
-    "31-45": "CSM/AE Outreach",
-    "46-60": "Management Escalation",
-    "61-90": "Demand Letter",
-    "91+": "Collections Review",
+    sys.intern(bucket): action
+    for bucket, action in {
+        "current": "No Action",
+        "1-20": "Accounting Outreach",
+        "21-30": "Accounting Outreach",
+        "31-45": "CSM/AE Outreach",
+        "46-60": "Management Escalation",
+        "61-90": "Demand Letter",
+        "91+": "Collections Review",
+    }.items()
 }
 
+# Inclusive upper bound (days past due) of every bucket except the open-ended "91+".
+_BUCKET_THRESHOLDS = (0, 20, 30, 45, 60, 90)
+
 
-@dataclass
+@dataclass(slots=True)
 class AgingTransaction:
     customer: str
     customer_ref: Optional[str]
@@ -42,19 +58,61 @@ class AgingTransaction:
     due_date: Optional[datetime]
     days_past_due: int
     bucket: BucketKey
-    amount: Decimal
+    bucket_idx: int  # position of ``bucket`` in BUCKET_ORDER
+    amount: int  # cents
+
+
+def _safe_cents(value: Any) -> int:
+    """Convert a QuickBooks amount into integer cents (0 when unparseable)."""
+    if value is None:
+        return 0
+    kind = type(value)
+    if kind is str:
+        cents = _plain_amount_cents(value)
+        if cents is not None:
+            return cents
+    elif kind is int:
+        return value * 100
+    # anything unusual (floats, exponents, extra precision) keeps exact Decimal rounding
+    try:
+        return int(Decimal(str(value)).scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+    except (ArithmeticError, ValueError):
+        return 0
+
+
+def _plain_amount_cents(value: str) -> Optional[int]:
+    """Parse amounts shaped like ``-1234.5`` without going through Decimal; None if not that shape."""
+    whole, _, frac = value.partition(".")
+    negative = whole.startswith("-")
+    if negative:
+        whole = whole[1:]
+    if not whole.isdigit() or len(frac) > 2 or (frac and not frac.isdigit()):
+        return None
+    cents = int(whole) * 100 + (int(frac.ljust(2, "0")) if frac else 0)
+    return -cents if negative else cents
 
 
-def _safe_decimal(value: Any) -> Decimal:
-    try:
-        return Decimal(str(value))
-    except Exception:
-        return Decimal("0")
+def _to_dollars(cents: int) -> float:
+    return cents / 100
 
 
 def _parse_date(value: Optional[str]) -> Optional[datetime]:
     if not value:
         return None
+    return _parse_date_cached(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_cached(value: str) -> Optional[datetime]:
+    """Parse a non-empty QuickBooks date; due dates repeat heavily within a report."""
+    # fast path for the plain YYYY-MM-DD shape QuickBooks almost always sends
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        year, month, day = value[:4], value[5:7], value[8:]
+        if year.isdigit() and month.isdigit() and day.isdigit():
+            try:
+                return datetime(int(year), int(month), int(day))
+            except ValueError:
+                return None
     try:
         return datetime.fromisoformat(value)
     except ValueError:
@@ -65,22 +123,23 @@ def _parse_date(value: Optional[str]) -> Optional[datetime]:
             return None
 
 
-def _bucket_for_days(days: int) -> BucketKey:
-    if days <= 0:
-        return "current"
-    if days <= 20:
-        return "1-20"
-    if days <= 30:
-        return "21-30"
-    if days <= 45:
-        return "31-45"
-    if days <= 60:
-        return "46-60"
-    if days <= 90:
-        return "61-90"
-    return "91+"
+@lru_cache(maxsize=256)
+def _bucket_index_for_days(days: int) -> int:
+    """Return the BUCKET_ORDER position for ``days`` past due."""
+    # bisect_left keeps the upper bound of each range inclusive (20 -> "1-20")
+    return bisect_left(_BUCKET_THRESHOLDS, days)
+
 
+def _is_older(txn: AgingTransaction, current: Optional[AgingTransaction]) -> bool:
+    """Return True when ``txn`` sits in a later bucket than ``current`` (or is further past due)."""
+    if current is None:
+        return True
+    if txn.bucket_idx != current.bucket_idx:
+        return txn.bucket_idx > current.bucket_idx
+    return txn.days_past_due > current.days_past_due
 
+
+@lru_cache(maxsize=8192)
 def _clean_customer_name(raw: str) -> str:
     """Normalize formatting and remove trailing QuickBooks suffixes such as ':COMP'."""
     cleaned = raw.split(":", 1)[0]
@@ -88,6 +147,7 @@ def _clean_customer_name(raw: str) -> str:
     return collapsed or raw.strip()
 
 
+@lru_cache(maxsize=8192)
 def _customer_key(name: str) -> str:
     """Canonicalize customer names for aggregation."""
     return " ".join(name.split()).casefold()
@@ -108,18 +168,19 @@ def _aggregate_customer_records(records: Iterable[Dict[str, Any]]) -> List[Dict[
             group = {
                 "customer": record["customer"],
                 "external_ref": None,
-                "total_balance": Decimal("0"),
-                "buckets": {bucket: Decimal("0") for bucket in BUCKET_ORDER},
-                "positive_transactions": [],
-                "credits": Decimal("0"),
+                "buckets": [0] * len(BUCKET_ORDER),
+                "oldest": None,
+                "credits": 0,
                 "external_refs": set(),
             }
             aggregated[canonical] = group
 
-        group["total_balance"] += record["total_balance"]
-        for bucket, amount in record["buckets"].items():
-            group["buckets"][bucket] += amount
-        group["positive_transactions"].extend(record["positive_transactions"])
+        group_buckets = group["buckets"]
+        for position, amount in enumerate(record["buckets"]):
+            group_buckets[position] += amount
+        oldest = record["oldest"]
+        if oldest is not None and _is_older(oldest, group["oldest"]):
+            group["oldest"] = oldest
         group["credits"] += record["credits"]
 
         ref = record.get("external_ref")
@@ -137,9 +198,8 @@ def _aggregate_customer_records(records: Iterable[Dict[str, Any]]) -> List[Dict[
             {
                 "customer": group["customer"],
                 "external_ref": None,
-                "total_balance": group["total_balance"],
-                "buckets": {bucket: amount for bucket, amount in group["buckets"].items()},
-                "positive_transactions": list(group["positive_transactions"]),
+                "buckets": list(group["buckets"]),
+                "oldest": group["oldest"],
                 "credits": group["credits"],
                 "external_refs": sorted(group["external_refs"]),
             }
@@ -147,8 +207,36 @@ def _aggregate_customer_records(records: Iterable[Dict[str, Any]]) -> List[Dict[
     return result
 
 
-def _extract_transactions(report: Dict[str, Any]) -> Iterable[AgingTransaction]:
-    header = report.get("Header", {})
+def _col_entry(data: List[Any], position: Optional[int]) -> Optional[Dict[str, Any]]:
+    if position is None or position >= len(data):
+        return None
+    entry = data[position]
+    if isinstance(entry, dict):
+        return entry
+    return None
+
+
+def _col_value(data: List[Any], position: Optional[int]) -> Optional[str]:
+    col = _col_entry(data, position)
+    if not col:
+        return None
+    value = col.get("value")
+    return str(value) if value is not None else None
+
+
+@dataclass(slots=True)
+class _ReportLayout:
+    """Per-report values needed to turn a Data row into an AgingTransaction."""
+
+    report_ord: int
+    txn_type: Optional[int]
+    customer: Optional[int]
+    doc_num: Optional[int]
+    due_date: Optional[int]
+    open_balance: Optional[int]
+
+
+def _report_layout(header: Dict[str, Any], columns: List[Dict[str, Any]]) -> _ReportLayout:
     report_date: Optional[datetime] = None
     for opt in header.get("Option", []):
         if opt.get("Name") == "report_date" and opt.get("Value"):
@@ -157,108 +245,144 @@ def _extract_transactions(report: Dict[str, Any]) -> Iterable[AgingTransaction]:
     if report_date is None:
         report_date = datetime.utcnow()
 
-    columns = report.get("Columns", {}).get("Column", [])
     # build index lookup to be safe
     idx = {col.get("MetaData", [{}])[0].get("Value"): i for i, col in enumerate(columns)}
+    # column positions are fixed for the whole report, so resolve them once
+    return _ReportLayout(
+        report_ord=report_date.toordinal(),
+        txn_type=idx.get("txn_type"),
+        customer=idx.get("cust_name"),
+        doc_num=idx.get("doc_num"),
+        due_date=idx.get("due_date"),
+        open_balance=idx.get("subt_open_bal"),
+    )
+
+
+def _section_transactions(section: Dict[str, Any], layout: _ReportLayout) -> Iterator[AgingTransaction]:
+    if section.get("type") != "Section":
+        return
+    report_ord = layout.report_ord
+    nested = section.get("Rows", {}).get("Row", [])
+    for entry in nested:
+        if entry.get("type") != "Data":
+            continue
+        data = entry.get("ColData", [])
 
-    rows = report.get("Rows", {}).get("Row", [])
-    for section in rows:
-        if section.get("type") != "Section":
+        # settled rows are the majority in most reports; drop them before any other parsing
+        balance_raw = _col_value(data, layout.open_balance)
+        if not balance_raw:
+            continue
+        open_balance = _safe_cents(balance_raw)
+        if open_balance == 0:
             continue
-        nested = section.get("Rows", {}).get("Row", [])
-        for entry in nested:
-            if entry.get("type") != "Data":
-                continue
-            data = entry.get("ColData", [])
-
-            def get_col_entry(key: str) -> Optional[Dict[str, Any]]:
-                position = idx.get(key)
-                if position is None or position >= len(data):
-                    return None
-                entry = data[position]
-                if isinstance(entry, dict):
-                    return entry
-                return None
 
-            def get_col_value(key: str) -> Optional[str]:
-                col = get_col_entry(key)
-                if not col:
-                    return None
-                value = col.get("value")
-                return str(value) if value is not None else None
-
-            def get_col_id(key: str) -> Optional[str]:
-                col = get_col_entry(key)
-                if not col:
-                    return None
-                ident = col.get("id")
-                return str(ident) if ident is not None else None
-
-            txn_type = get_col_value("txn_type") or ""
-            customer_raw = get_col_value("cust_name") or "Unknown"
-            customer = _clean_customer_name(customer_raw)
-            doc_num = get_col_value("doc_num")
-            customer_ref = get_col_id("cust_name")
-            open_balance = _safe_decimal(get_col_value("subt_open_bal") or 0)
-            if open_balance == 0:
-                continue
-
-            due_date = _parse_date(get_col_value("due_date"))
-            days_past_due = 0
-            if due_date is not None:
-                days_past_due = (report_date.date() - due_date.date()).days
-
-            bucket = _bucket_for_days(days_past_due)
-
-            yield AgingTransaction(
-                customer=customer,
-                customer_ref=customer_ref,
-                doc_num=doc_num,
-                txn_type=txn_type,
-                due_date=due_date,
-                days_past_due=days_past_due,
-                bucket=bucket,
-                amount=open_balance,
-            )
+        customer_col = _col_entry(data, layout.customer) or {}
+        customer_name = customer_col.get("value")
+        customer_ident = customer_col.get("id")
+        customer_raw = str(customer_name) if customer_name is not None else ""
+        customer = _clean_customer_name(customer_raw or "Unknown")
+        customer_ref = str(customer_ident) if customer_ident is not None else None
+        txn_type = _col_value(data, layout.txn_type) or ""
+        doc_num = _col_value(data, layout.doc_num)
+
+        due_date = _parse_date(_col_value(data, layout.due_date))
+        days_past_due = 0
+        if due_date is not None:
+            days_past_due = report_ord - due_date.toordinal()
+
+        bucket_idx = _bucket_index_for_days(days_past_due)
+
+        yield AgingTransaction(
+            customer=customer,
+            customer_ref=customer_ref,
+            doc_num=doc_num,
+            txn_type=txn_type,
+            due_date=due_date,
+            days_past_due=days_past_due,
+            bucket=BUCKET_ORDER[bucket_idx],
+            bucket_idx=bucket_idx,
+            amount=open_balance,
+        )
 
 
-def simplify_ar_aging(report: Dict[str, Any], *, aggregate_customers: bool = False) -> Dict[str, Any]:
-    """Convert QuickBooks report payload into collections-ready summary."""
+def _extract_transactions(report: Dict[str, Any]) -> Iterator[AgingTransaction]:
+    layout = _report_layout(report.get("Header", {}), report.get("Columns", {}).get("Column", []))
+    for section in report.get("Rows", {}).get("Row", []):
+        yield from _section_transactions(section, layout)
+
 
+def _stream_transactions(file_obj: IO[bytes], header: Dict[str, Any]) -> Iterator[AgingTransaction]:
+    """
+    Walk a raw report JSON document with ijson, yielding transactions one section at a time.
+
+    ``header`` is filled in as the ``Header`` object is parsed. QuickBooks emits ``Header`` and
+    ``Columns`` before ``Rows``, so the layout is known by the time the first section arrives.
+    """
+    columns: List[Dict[str, Any]] = []
+    layout: Optional[_ReportLayout] = None
+    builder: Optional[ijson.ObjectBuilder] = None
+    target = ""
+    for prefix, event, value in ijson.parse(file_obj):
+        if builder is None:
+            if prefix in ("Header", "Columns.Column", "Rows.Row.item") and event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                target = prefix
+                builder.event(event, value)
+            continue
+
+        builder.event(event, value)
+        if prefix != target or event not in ("end_map", "end_array"):
+            continue
+
+        built, builder = builder.value, None
+        if target == "Header":
+            header.update(built)
+        elif target == "Columns.Column":
+            columns = built
+        else:
+            if layout is None:
+                layout = _report_layout(header, columns)
+            yield from _section_transactions(built, layout)
+
+
+def _summarize_transactions(
+    transactions: Iterable[AgingTransaction], *, aggregate_customers: bool
+) -> List[Dict[str, Any]]:
     customers: Dict[str, Dict[str, Any]] = {}
 
-    for txn in _extract_transactions(report):
+    for txn in transactions:
         key = txn.customer_ref or _customer_key(txn.customer)
-        record = customers.setdefault(
-            key,
-            {
+        record = customers.get(key)
+        if record is None:
+            # build the record only on first sight; setdefault would allocate it for every transaction
+            record = {
                 "customer": txn.customer,
                 "external_ref": txn.customer_ref,
-                "total_balance": Decimal("0"),
-                "buckets": {bucket: Decimal("0") for bucket in BUCKET_ORDER},
-                "positive_transactions": [],
-                "credits": Decimal("0"),
-            },
-        )
+                "buckets": [0] * len(BUCKET_ORDER),
+                "oldest": None,
+                "casing_set": False,
+                "credits": 0,
+            }
+            customers[key] = record
 
-        record["total_balance"] += txn.amount
-        record["buckets"][txn.bucket] += txn.amount
+        record["buckets"][txn.bucket_idx] += txn.amount
 
         if txn.amount > 0:
-            record["positive_transactions"].append(txn)
+            # oldest bucket is determined from positive transactions only
+            if _is_older(txn, record["oldest"]):
+                record["oldest"] = txn
+            # prefer human-friendly casing from the first positive transaction
+            if not record["casing_set"]:
+                record["customer"] = txn.customer
+                record["casing_set"] = True
         else:
             record["credits"] += txn.amount
 
-        # prefer human-friendly casing from the first positive transaction
-        if record["customer"] != txn.customer and record["positive_transactions"]:
-            record["customer"] = record["positive_transactions"][0].customer
         if not record["external_ref"] and txn.customer_ref:
             record["external_ref"] = txn.customer_ref
 
     output: List[Dict[str, Any]] = []
 
-    bucket_rank = {bucket: idx for idx, bucket in enumerate(BUCKET_ORDER)}
-
     records: List[Dict[str, Any]]
     if aggregate_customers:
         records = _aggregate_customer_records(customers.values())
@@ -266,21 +390,12 @@ def simplify_ar_aging(report: Dict[str, Any], *, aggregate_customers: bool = Fal
         records = list(customers.values())
 
     for record in records:
-        total_balance = record["total_balance"]
+        # every transaction lands in exactly one bucket, so the bucket sums add up to the balance
+        total_balance = sum(record["buckets"])
         if total_balance <= 0:
             continue
 
-        # determine oldest bucket based on positive transactions only
-        oldest_txn: Optional[AgingTransaction] = None
-        for txn in record["positive_transactions"]:
-            if oldest_txn is None:
-                oldest_txn = txn
-                continue
-            if bucket_rank[txn.bucket] > bucket_rank[oldest_txn.bucket]:
-                oldest_txn = txn
-            elif bucket_rank[txn.bucket] == bucket_rank[oldest_txn.bucket]:
-                if txn.days_past_due > oldest_txn.days_past_due:
-                    oldest_txn = txn
+        oldest_txn: Optional[AgingTransaction] = record["oldest"]
 
         recommended_bucket: Optional[BucketKey] = None
         recommended_action: Optional[str] = None
@@ -295,22 +410,25 @@ def simplify_ar_aging(report: Dict[str, Any], *, aggregate_customers: bool = Fal
                 "txn_type": oldest_txn.txn_type,
                 "due_date": oldest_txn.due_date.date().isoformat() if oldest_txn.due_date else None,
                 "days_past_due": oldest_txn.days_past_due,
-                "amount": float(oldest_txn.amount),
+                "amount": _to_dollars(oldest_txn.amount),
             }
             if oldest_txn.customer_ref:
                 external_ref = oldest_txn.customer_ref
 
-        bucket_output = {k: float(v) for k, v in record["buckets"].items()}
+        bucket_output: Dict[BucketKey, float]
         if recommended_bucket:
-            bucket_output = {key: 0.0 for key in BUCKET_ORDER}
-            bucket_output[recommended_bucket] = float(total_balance)
+            # the whole balance is reported in the oldest bucket
+            bucket_output = dict.fromkeys(BUCKET_ORDER, 0.0)
+            bucket_output[recommended_bucket] = _to_dollars(total_balance)
+        else:
+            bucket_output = {BUCKET_ORDER[i]: _to_dollars(v) for i, v in enumerate(record["buckets"])}
 
         row = {
             "customer": record["customer"],
             "external_ref": external_ref,
-            "total_balance": float(total_balance),
+            "total_balance": _to_dollars(total_balance),
             "buckets": bucket_output,
-            "credits": float(record["credits"]),
+            "credits": _to_dollars(record["credits"]),
             "recommended_action": recommended_action,
             "oldest_invoice": oldest_invoice_info,
         }
@@ -324,12 +442,32 @@ def simplify_ar_aging(report: Dict[str, Any], *, aggregate_customers: bool = Fal
         output.append(row)
 
     # sort by largest total balance desc
-    output.sort(key=lambda item: item["total_balance"], reverse=True)
+    output.sort(key=itemgetter("total_balance"), reverse=True)
+    return output
+
 
+def simplify_ar_aging(report: Dict[str, Any], *, aggregate_customers: bool = False) -> Dict[str, Any]:
+    """Convert QuickBooks report payload into collections-ready summary."""
+    rows = _summarize_transactions(_extract_transactions(report), aggregate_customers=aggregate_customers)
     return {
         "generated_at": report.get("Header", {}).get("Time"),
-        "rows": output,
+        "rows": rows,
+    }
+
+
+def simplify_ar_aging_stream(file_obj: IO[bytes], *, aggregate_customers: bool = False) -> Dict[str, Any]:
+    """
+    Same summary as :func:`simplify_ar_aging`, read incrementally from a raw JSON file object.
+
+    Only one report section is held in memory at a time, which keeps peak memory flat for
+    multi-megabyte QuickBooks payloads.
+    """
+    header: Dict[str, Any] = {}
+    rows = _summarize_transactions(_stream_transactions(file_obj, header), aggregate_customers=aggregate_customers)
+    return {
+        "generated_at": header.get("Time"),
+        "rows": rows,
     }
 
 
-__all__ = ["simplify_ar_aging"]
+__all__ = ["simplify_ar_aging", "simplify_ar_aging_stream"]
@@ -1,19 +1,34 @@
-import json
+import asyncio
+import hashlib
 import logging
-import httpx, jwt
+import re
+import time
+import httpx, jwt, orjson
+from collections import OrderedDict
 from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, Request, Security, status
 from fastapi.security import HTTPBearer
 from urllib.parse import urlparse
 
 from .config import settings
 
 logger = logging.getLogger(__name__)
-bearer = HTTPBearer(auto_error=True)
+_HTTP: Optional[httpx.AsyncClient] = None  # pooled keep-alive client for JWKS fetches
 _JWKS: Optional[Dict[str, Any]] = None
-_JWKS_FETCHED_AT: Optional[datetime] = None
-_JWKS_TTL = timedelta(minutes=10)  # simple refresh window
+_JWKS_FETCHED_AT: float = 0.0  # time.monotonic() of the last successful fetch/revalidation
+_JWKS_TTL_SECONDS = 600.0  # simple refresh window
+# validators/freshness from the last JWKS response, used to revalidate instead of re-downloading
+_JWKS_ETAG: Optional[str] = None
+_JWKS_LAST_MOD: Optional[str] = None
+_JWKS_MAX_AGE: Optional[float] = None  # seconds
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)", re.IGNORECASE)
+_REFRESH_TASK: Optional["asyncio.Task[None]"] = None  # in-flight JWKS fetch shared by all callers
+# raw JWKS entries by kid, rebuilt whenever _JWKS is replaced
+_JWKS_INDEX: Dict[str, Dict[str, Any]] = {}
+# parsed public keys by kid -> (key, alg); only valid for the current _JWKS
+_PARSED_KEYS: Dict[str, tuple[Any, str]] = {}
+# verified token payloads keyed by sha256(token) -> (payload, expires_at epoch seconds)
+_VERIFIED: "OrderedDict[bytes, tuple[Dict[str, Any], float]]" = OrderedDict()
 
 def _iss() -> str:
     """Return the Supabase issuer (…/auth/v1) derived from the JWKS URL."""
@@ -25,35 +40,105 @@ def _iss() -> str:
     parsed = urlparse(url)
     return f"{parsed.scheme}://{parsed.netloc}"
 
-async def _fetch_jwks() -> Dict[str, Any]:
+_ISS = _iss()  # settings are fixed for the process, so resolve the issuer once
+
+def _http_client() -> httpx.AsyncClient:
+    """Return the process-wide client used for JWKS fetches, creating it on first use."""
+    global _HTTP
+    # created without awaiting, so concurrent first callers cannot race on the event loop
+    if _HTTP is None:
+        _HTTP = httpx.AsyncClient(
+            timeout=10,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4),
+        )
+    return _HTTP
+
+async def aclose_http_client() -> None:
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
+def _parse_max_age(cache_control: Optional[str]) -> Optional[float]:
+    match = _MAX_AGE_RE.search(cache_control or "")
+    return float(match.group(1)) if match else None
+
+def _jwks_ttl() -> float:
+    # honor a longer upstream max-age, but never revalidate more often than our own window
+    if _JWKS_MAX_AGE is not None and _JWKS_MAX_AGE > _JWKS_TTL_SECONDS:
+        return _JWKS_MAX_AGE
+    return _JWKS_TTL_SECONDS
+
+async def _fetch_jwks() -> Optional[Dict[str, Any]]:
+    """Fetch the JWKS, revalidating the cached copy; returns None when upstream says 304."""
+    global _JWKS_ETAG, _JWKS_LAST_MOD, _JWKS_MAX_AGE
     logger.debug("Fetching Supabase JWKS from %s", settings.SUPABASE_JWKS_URL)
-    async with httpx.AsyncClient(timeout=10) as client:
-        headers = {"apikey": settings.SUPABASE_ANON_KEY}
-        r = await client.get(settings.SUPABASE_JWKS_URL, headers=headers)
-        r.raise_for_status()
-        data = r.json()
+    headers = {"apikey": settings.SUPABASE_ANON_KEY}
+    if _JWKS is not None:
+        if _JWKS_ETAG:
+            headers["If-None-Match"] = _JWKS_ETAG
+        if _JWKS_LAST_MOD:
+            headers["If-Modified-Since"] = _JWKS_LAST_MOD
+    r = await _http_client().get(settings.SUPABASE_JWKS_URL, headers=headers)
+    if r.status_code == 304 and _JWKS is not None:
+        # a 304 may refresh max-age; keep the previous one only if it carries none (0 is a value)
+        max_age = _parse_max_age(r.headers.get("cache-control"))
+        if max_age is not None:
+            _JWKS_MAX_AGE = max_age
+        logger.debug("Supabase JWKS not modified")
+        return None
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    _JWKS_ETAG = r.headers.get("etag")
+    _JWKS_LAST_MOD = r.headers.get("last-modified")
+    _JWKS_MAX_AGE = _parse_max_age(r.headers.get("cache-control"))
     logger.debug("Fetched Supabase JWKS payload (%d keys)", len(data.get("keys", [])))
     return data
 
+async def _refresh_jwks() -> None:
+    global _JWKS, _JWKS_FETCHED_AT, _JWKS_INDEX, _PARSED_KEYS
+    data = await _fetch_jwks()
+    _JWKS_FETCHED_AT = time.monotonic()
+    if data is not None:
+        _JWKS = data
+        _JWKS_INDEX = {k["kid"]: k for k in data.get("keys", []) if k.get("kid")}
+        _PARSED_KEYS = {}
+
+def _clear_refresh_task(task: "asyncio.Task[None]") -> None:
+    global _REFRESH_TASK
+    if _REFRESH_TASK is task:
+        _REFRESH_TASK = None
+    if not task.cancelled():
+        task.exception()  # waiters re-raise it; mark it retrieved even if they all went away
+
 async def get_jwks(force: bool = False) -> Dict[str, Any]:
-    global _JWKS, _JWKS_FETCHED_AT
-    needs_refresh = (
-        force
-        or _JWKS is None
-        or _JWKS_FETCHED_AT is None
-        or (datetime.utcnow() - _JWKS_FETCHED_AT) > _JWKS_TTL
-    )
+    global _REFRESH_TASK
+    age = time.monotonic() - _JWKS_FETCHED_AT
+    needs_refresh = force or _JWKS is None or age > _jwks_ttl()
     if needs_refresh:
-        logger.info("Refreshing Supabase JWKS cache (force=%s)", force)
-        _JWKS = await _fetch_jwks()
-        _JWKS_FETCHED_AT = datetime.utcnow()
+        # single-flight: concurrent callers (e.g. on key rotation) share one in-flight fetch
+        task = _REFRESH_TASK
+        if task is None:
+            logger.info("Refreshing Supabase JWKS cache (force=%s)", force)
+            task = asyncio.create_task(_refresh_jwks())
+            task.add_done_callback(_clear_refresh_task)
+            _REFRESH_TASK = task
+        else:
+            logger.debug("Joining in-flight Supabase JWKS refresh (force=%s)", force)
+        # shield so one cancelled request does not abort the fetch for every waiter
+        await asyncio.shield(task)
     else:
-        age = (datetime.utcnow() - _JWKS_FETCHED_AT).total_seconds() if _JWKS_FETCHED_AT else 0.0
         logger.debug("Using cached Supabase JWKS (age=%.1fs)", age)
     return _JWKS
 
-def _public_key_from_kid(jwks: Dict[str, Any], kid: str) -> tuple[Optional[Any], Optional[str]]:
-    key = next((k for k in jwks.get("keys", []) if k.get("kid") == kid), None)
+def _public_key_from_kid(kid: str) -> tuple[Optional[Any], Optional[str]]:
+    # looks kid up in _JWKS_INDEX, i.e. the document the last get_jwks() call left in place
+    cached = _PARSED_KEYS.get(kid)
+    if cached is not None:
+        return cached
+
+    key = _JWKS_INDEX.get(kid)
     if not key:
         logger.warning("JWKS key not found for kid=%s", kid)
         return None, None
@@ -77,12 +162,67 @@ def _public_key_from_kid(jwks: Dict[str, Any], kid: str) -> tuple[Optional[Any],
 
     logger.debug("Resolved JWKS key for kid=%s using alg=%s", kid, alg)
     # PyJWT accepts a JSON string for from_jwk; passing str is safest across versions
-    return algorithm.from_jwk(json.dumps(key)), alg
+    resolved = (algorithm.from_jwk(orjson.dumps(key).decode()), alg)
+    _PARSED_KEYS[kid] = resolved
+    return resolved
+
+def _cached_payload(cache_key: bytes) -> Optional[Dict[str, Any]]:
+    entry = _VERIFIED.get(cache_key)
+    if entry is None:
+        return None
+    payload, expires_at = entry
+    if expires_at <= time.time():
+        _VERIFIED.pop(cache_key, None)
+        return None
+    # keep hot tokens at the young end so size eviction drops the least recently used
+    _VERIFIED.move_to_end(cache_key)
+    return payload
+
+def _remember_payload(cache_key: bytes, payload: Dict[str, Any]) -> None:
+    # never cache past the token's own expiry (exp is wall-clock epoch seconds)
+    expires_at = time.time() + settings.AUTH_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        expires_at = min(expires_at, float(exp))
+    _VERIFIED[cache_key] = (payload, expires_at)
+    _VERIFIED.move_to_end(cache_key)
+    # no awaits between check and pop, so eviction needs no lock on the event loop
+    while len(_VERIFIED) > settings.AUTH_CACHE_MAXSIZE:
+        _VERIFIED.popitem(last=False)
 
-async def get_current_user(token=Depends(bearer)):
+class _BearerHeader(HTTPBearer):
+    """HTTPBearer for the OpenAPI security scheme; hands over the raw header for _bearer_credentials."""
+
+    async def __call__(self, request: Request) -> Optional[str]:  # type: ignore[override]
+        return request.headers.get("Authorization")
+
+# same scheme name the plain HTTPBearer dependency published, so generated clients keep working
+bearer = _BearerHeader(scheme_name="HTTPBearer", auto_error=False)
+
+def _bearer_credentials(authorization: Optional[str]) -> str:
+    # same checks and errors as HTTPBearer(auto_error=True), without building its model per request
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if not (scheme and credentials):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid authentication credentials")
+    return credentials
+
+async def get_current_user(authorization: Optional[str] = Security(bearer)):
+    credentials = _bearer_credentials(authorization)
+    # frontends reuse one access token for many requests; skip re-verifying it within the TTL
+    cache_key = hashlib.sha256(credentials.encode()).digest()
+    payload = _cached_payload(cache_key)
+    if payload is not None:
+        return payload
+    payload = await _verify_token(credentials)
+    _remember_payload(cache_key, payload)
+    return payload
+
+async def _verify_token(credentials: str) -> Dict[str, Any]:
     # 1) parse unverified header to get kid
     try:
-        unverified_header = jwt.get_unverified_header(token.credentials)
+        unverified_header = jwt.get_unverified_header(credentials)
         kid = unverified_header.get("kid")
         alg = unverified_header.get("alg")
         logger.debug("Parsed Supabase JWT header kid=%s alg=%s", kid, alg)
@@ -90,64 +230,42 @@ async def get_current_user(token=Depends(bearer)):
         logger.warning("Failed to parse Supabase JWT header")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    public_key: Optional[Any] = None
+    hs_signed = bool(alg and alg.startswith("HS"))
+    if hs_signed and not settings.SUPABASE_JWT_SECRET:
+        logger.error("SUPABASE_JWT_SECRET is not configured but HS-signed token was provided")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    if alg and alg.startswith("HS"):
-        # Supabase default access tokens are signed with the JWT secret using HS256.
-        secret = settings.SUPABASE_JWT_SECRET
-        if not secret:
-            logger.error("SUPABASE_JWT_SECRET is not configured but HS-signed token was provided")
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        public_key = secret
-    else:
-        # 2) get key, retry once on miss (handles rotation)
-        jwks = await get_jwks()
-        public_key, alg_from_jwks = _public_key_from_kid(jwks, kid or "")
-        if public_key is None or alg_from_jwks is None:
-            logger.info("JWKS cache miss for kid=%s; forcing refresh", kid)
-            jwks = await get_jwks(force=True)
-            public_key, alg_from_jwks = _public_key_from_kid(jwks, kid or "")
+    # 2) resolve the key and verify; JWKS-signed tokens get one retry against a forced
+    #    refresh (handles rotation), HS tokens are checked against the secret only once
+    for force in (False,) if hs_signed else (False, True):
+        if hs_signed:
+            # Supabase default access tokens are signed with the JWT secret using HS256.
+            public_key: Optional[Any] = settings.SUPABASE_JWT_SECRET
+            verify_alg = alg
+        else:
+            await get_jwks(force=force)
+            public_key, alg_from_jwks = _public_key_from_kid(kid or "")
             if public_key is None or alg_from_jwks is None:
-                logger.error("Unable to resolve JWKS key for kid=%s after refresh", kid)
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        if not alg:
-            alg = alg_from_jwks
+                logger.info("Unable to resolve JWKS key for kid=%s (forced refresh=%s)", kid, force)
+                continue
+            verify_alg = alg or alg_from_jwks
 
-    # 3) verify (exp/nbf/signature on by default). We disable aud; we DO verify issuer.
-    try:
-        payload = jwt.decode(
-            token.credentials,
-            public_key,
-            algorithms=[alg],
-            issuer=_iss(),            # verify iss matches your Supabase project
-            options={"verify_aud": False},
-        )
-        logger.debug("Supabase JWT validated for subject=%s", payload.get("sub"))
-        return payload  # includes "sub", "email", etc.
-    except jwt.ExpiredSignatureError:
-        logger.warning("Supabase JWT expired for kid=%s", kid)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except Exception:
-        # On generic failure (e.g., rotated keys not yet fetched), try one more JWKS refresh
-        if alg and alg.startswith("HS"):
-            logger.warning("Supabase JWT verification failed for kid=%s using HS secret", kid)
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-        logger.warning("Supabase JWT verification failed for kid=%s; retrying with forced JWKS refresh", kid)
-        jwks = await get_jwks(force=True)
-        public_key, alg = _public_key_from_kid(jwks, kid or "")
-        if public_key is None or alg is None:
-            logger.error("Unable to resolve JWKS key for kid=%s after forced refresh", kid)
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        # 3) verify (exp/nbf/signature on by default). We disable aud; we DO verify issuer.
         try:
             payload = jwt.decode(
-                token.credentials,
+                credentials,
                 public_key,
-                algorithms=[alg],
-                issuer=_iss(),
+                algorithms=[verify_alg],
+                issuer=_ISS,            # verify iss matches your Supabase project
                 options={"verify_aud": False},
             )
-            logger.debug("Supabase JWT validated after JWKS refresh for subject=%s", payload.get("sub"))
-            return payload
+            logger.debug("Supabase JWT validated for subject=%s", payload.get("sub"))
+            return payload  # includes "sub", "email", etc.
+        except jwt.ExpiredSignatureError:
+            logger.warning("Supabase JWT expired for kid=%s", kid)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
         except Exception:
-            logger.warning("Supabase JWT verification failed after JWKS refresh for kid=%s", kid)
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+            # e.g. rotated keys not yet fetched; the next pass (if any) forces a JWKS refresh
+            logger.warning("Supabase JWT verification failed for kid=%s (forced refresh=%s)", kid, force)
+
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
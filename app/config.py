@@ -1,4 +1,5 @@
 # app/config.py
+from functools import cached_property
 from typing import Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -14,13 +15,17 @@ class Settings(BaseSettings):
     QBO_CLIENT_SECRET: str
     QBO_REDIRECT_URL: str           # e.g. http://localhost:8000/auth/quickbooks/callback
     QBO_ENV: str = "production"        # or "production"
+    AUTH_CACHE_MAXSIZE: int = 10_000    # verified JWTs kept in memory
+    AUTH_CACHE_TTL_SECONDS: float = 10.0  # how long a verified JWT skips re-verification
+    AR_REPORT_CACHE_TTL_SECONDS: float = 60.0  # how long an A/R aging report is served from memory
+    REDIS_URL: Optional[str] = None  # shared OAuth state across workers; in-process when unset
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
 
-    @property
-    def allowed_origins(self) -> list[str]:
-        return [origin.strip() for origin in self.ALLOWED_ORIGINS.split(",") if origin.strip()]
+    @cached_property
+    def allowed_origins(self) -> tuple[str, ...]:
+        return tuple(origin.strip() for origin in self.ALLOWED_ORIGINS.split(",") if origin.strip())
 
 settings = Settings()
@@ -0,0 +1,47 @@
+# app/http_clients.py
+"""Shared, pooled HTTP clients for talking to Intuit."""
+
+from typing import Optional
+
+import httpx
+
+QBO_TOKEN_BASE = "https://oauth.platform.intuit.com"
+QBO_API_BASE = "https://quickbooks.api.intuit.com"
+
+# pool=None: long report calls queued behind others should wait for a connection, not time out
+_TIMEOUT = httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=None)
+_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+
+_TOKEN_CLIENT: Optional[httpx.AsyncClient] = None
+_API_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _new_client(base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(base_url=base_url, http2=True, timeout=_TIMEOUT, limits=_LIMITS)
+
+
+def qbo_token_client() -> httpx.AsyncClient:
+    """Return the keep-alive client for the Intuit OAuth token endpoint."""
+    global _TOKEN_CLIENT
+    if _TOKEN_CLIENT is None:
+        _TOKEN_CLIENT = _new_client(QBO_TOKEN_BASE)
+    return _TOKEN_CLIENT
+
+
+def qbo_api_client() -> httpx.AsyncClient:
+    """Return the keep-alive client for the QuickBooks accounting API."""
+    global _API_CLIENT
+    if _API_CLIENT is None:
+        _API_CLIENT = _new_client(QBO_API_BASE)
+    return _API_CLIENT
+
+
+async def aclose_qbo_clients() -> None:
+    global _TOKEN_CLIENT, _API_CLIENT
+    for client in (_TOKEN_CLIENT, _API_CLIENT):
+        if client is not None:
+            await client.aclose()
+    _TOKEN_CLIENT = _API_CLIENT = None
+
+
+__all__ = ["qbo_token_client", "qbo_api_client", "aclose_qbo_clients"]
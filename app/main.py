@@ -1,14 +1,43 @@
 # app/main.py
+import re
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from .auth import aclose_http_client
 from .config import settings
+from .http_clients import aclose_qbo_clients
+from .state_store import aclose_state_store
+from .supabase_client import aclose_supabase_client
 from .routers import qboauth
 
-app = FastAPI(title="Collections Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await aclose_http_client()
+    await aclose_qbo_clients()
+    await aclose_supabase_client()
+    await aclose_state_store()
+
+
+app = FastAPI(title="Collections Service", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Starlette checks allow_origins with a linear scan per request; past a handful
+# of origins a single compiled alternation is cheaper. "*" stays a plain list so
+# the middleware still recognises allow-all.
+_ORIGINS = settings.allowed_origins
+if len(_ORIGINS) > 4 and "*" not in _ORIGINS:
+    _cors_origins = {"allow_origin_regex": "|".join(re.escape(o) for o in _ORIGINS)}
+else:
+    _cors_origins = {"allow_origins": _ORIGINS}
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.allowed_origins,
+    **_cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -16,9 +45,16 @@ app.add_middleware(
 
 app.include_router(qboauth.router)
 
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+_HEALTH_BODY = b'{"status":"ok"}'
+
+
+async def health(request: Request) -> Response:
+    # plain Starlette route: no dependency solving or response-model
+    # serialization for the load balancer's polling
+    return Response(_HEALTH_BODY, media_type="application/json")
+
+
+app.add_route("/health", health, methods=["GET"], include_in_schema=False)
 
 
 if __name__ == "__main__":
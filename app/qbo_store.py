@@ -4,36 +4,45 @@
 from __future__ import annotations
 
 import asyncio
+import sys
+import time
 from datetime import datetime
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Dict, Iterable, Optional, Sequence
 
-from supabase import Client
+from supabase import AClient
 
 CONNECTION_TABLE = "qb_connections"
 CUSTOMERS_TABLE = "customers"
 INVOICES_TABLE = "invoices"
 
+# connection rows only change on token refresh, so serve repeat lookups from memory briefly
+CONNECTION_CACHE_TTL = 30.0  # seconds
+_CONN_CACHE: Dict[str, tuple[Dict[str, Any], float]] = {}  # user_id -> (record, monotonic expiry)
+
+# refs per in.(...) lookup; larger sets are split into concurrent requests to keep URLs short
+METADATA_BATCH_SIZE = 1000
+
+if sys.version_info >= (3, 11):
+    # 3.11+ fromisoformat understands a trailing "Z" and the other shapes PostgREST emits
+    _fromisoformat = datetime.fromisoformat
+else:
+    def _fromisoformat(value: str) -> datetime:
+        return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+
 
 def _parse_iso_datetime(value: Any) -> Any:
     if isinstance(value, datetime):
         return value
     if isinstance(value, str):
-        iso = value.rstrip("Z") + ("+00:00" if value.endswith("Z") else "")
         try:
-            return datetime.fromisoformat(iso)
+            return _fromisoformat(value)
         except ValueError:
             return value
     return value
 
 
-def _format_iso_datetime(value: Any) -> Any:
-    if isinstance(value, datetime):
-        return value.isoformat()
-    return value
-
-
-def _fetch_connection_sync(supabase: Client, user_id: str):
-    return (
+async def _fetch_connection(supabase: AClient, user_id: str):
+    return await (
         supabase
         .table(CONNECTION_TABLE)
         .select("*")
@@ -43,18 +52,23 @@ def _fetch_connection_sync(supabase: Client, user_id: str):
     )
 
 
-async def fetch_connection(supabase: Client, user_id: str) -> Optional[Dict[str, Any]]:
-    resp = await asyncio.to_thread(_fetch_connection_sync, supabase, user_id)
+async def fetch_connection(supabase: AClient, user_id: str, *, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+    cached = _CONN_CACHE.get(user_id) if use_cache else None
+    if cached is not None and cached[1] > time.monotonic():
+        # hand out copies so callers mutating the record (token refresh) can't corrupt the cache
+        return dict(cached[0])
+    resp = await _fetch_connection(supabase, user_id)
     data = resp.data if resp else None
     if not data:
         return None
     if "expires_at" in data:
         data["expires_at"] = _parse_iso_datetime(data["expires_at"])
-    return data
+    _CONN_CACHE[user_id] = (data, time.monotonic() + CONNECTION_CACHE_TTL)
+    return dict(data)
 
 
-def _upsert_connection_sync(supabase: Client, record: Dict[str, Any]):
-    return (
+async def _upsert_connection(supabase: AClient, record: Dict[str, Any]):
+    return await (
         supabase
         .table(CONNECTION_TABLE)
         .upsert(record, on_conflict="user_id")
@@ -62,36 +76,37 @@ def _upsert_connection_sync(supabase: Client, record: Dict[str, Any]):
     )
 
 
-async def upsert_connection(supabase: Client, record: Dict[str, Any]) -> None:
-    to_store = {**record}
-    if "expires_at" in to_store:
-        to_store["expires_at"] = _format_iso_datetime(to_store["expires_at"])
-    await asyncio.to_thread(_upsert_connection_sync, supabase, to_store)
+async def upsert_connection(supabase: AClient, record: Dict[str, Any]) -> None:
+    to_store = record
+    if isinstance(record.get("expires_at"), datetime):
+        # copy only when a field needs normalizing; the caller's record stays untouched
+        to_store = record | {"expires_at": record["expires_at"].isoformat()}
+    await _upsert_connection(supabase, to_store)
+    # drop after the write so a read racing the upsert can't re-cache the old row
+    _CONN_CACHE.pop(record.get("user_id"), None)
 
 
-def _select_customer_sync(supabase: Client, external_ref: str):
-    return (
+async def _upsert_customer(supabase: AClient, external_ref: str, name: str):
+    # only identity columns: on conflict this refreshes the name and leaves status fields intact
+    return await (
         supabase
         .table(CUSTOMERS_TABLE)
-        .select("id,name")
-        .eq("external_ref", external_ref)
-        .maybe_single()
+        .upsert({"external_ref": external_ref, "name": name}, on_conflict="external_ref")
         .execute()
     )
 
 
-def _insert_customer_sync(supabase: Client, payload: Dict[str, Any]):
-    builder = (
+async def _upsert_customers(supabase: AClient, rows: Sequence[Dict[str, str]]):
+    return await (
         supabase
         .table(CUSTOMERS_TABLE)
-        .insert(payload)
+        .upsert(list(rows), on_conflict="external_ref")
         .execute()
     )
-    return builder
 
 
-def _update_customer_sync(supabase: Client, customer_id: str, payload: Dict[str, Any]):
-    return (
+async def _update_customer(supabase: AClient, customer_id: str, payload: Dict[str, Any]):
+    return await (
         supabase
         .table(CUSTOMERS_TABLE)
         .update(payload)
@@ -100,63 +115,57 @@ def _update_customer_sync(supabase: Client, customer_id: str, payload: Dict[str,
     )
 
 
-def _update_customer_by_ref_sync(supabase: Client, external_ref: str, payload: Dict[str, Any]):
-    return (
-        supabase
-        .table(CUSTOMERS_TABLE)
-        .update(payload)
-        .eq("external_ref", external_ref)
-        .execute()
-    )
-
-
-async def get_or_create_customer_id(supabase: Client, external_ref: str, name: str) -> str:
-    existing = await asyncio.to_thread(_select_customer_sync, supabase, external_ref)
-    if existing and existing.data:
-        record = existing.data[0] if isinstance(existing.data, list) else existing.data
-        if record.get("name") != name:
-            await asyncio.to_thread(_update_customer_sync, supabase, record["id"], {"name": name})
+async def get_or_create_customer_id(supabase: AClient, external_ref: str, name: str) -> str:
+    resp = await _upsert_customer(supabase, external_ref, name)
+    rows = resp.data if resp else None
+    record = rows[0] if isinstance(rows, list) and rows else rows
+    if record and record.get("id"):
         return record["id"]
-    await asyncio.to_thread(
-        _insert_customer_sync,
-        supabase,
-        {
-            "external_ref": external_ref,
-            "name": name,
-            "action_taken": None,
-            "slack_updated": False,
-            "follow_up": False,
-            "escalation": False,
-        },
-    )
-    existing_after = await asyncio.to_thread(_select_customer_sync, supabase, external_ref)
-    if existing_after and existing_after.data:
-        record = existing_after.data[0] if isinstance(existing_after.data, list) else existing_after.data
-        if record and record.get("id"):
-            return record["id"]
     raise RuntimeError("Failed to create customer record")
 
 
-def _fetch_customers_metadata_sync(supabase: Client, external_refs: Sequence[str]):
-    return (
+async def bulk_get_or_create_customers(
+    supabase: AClient, customers: Iterable[tuple[str, str]]
+) -> Dict[str, str]:
+    """Upsert (external_ref, name) pairs and return external_ref -> customer id."""
+    # one row per ref: Postgres rejects an upsert that touches the same row twice
+    names = dict(customers)
+    if not names:
+        return {}
+    rows = [{"external_ref": ref, "name": name} for ref, name in names.items()]
+    batches = [rows[start:start + METADATA_BATCH_SIZE] for start in range(0, len(rows), METADATA_BATCH_SIZE)]
+    responses = await asyncio.gather(*(_upsert_customers(supabase, batch) for batch in batches))
+    ids = {row["external_ref"]: row["id"] for resp in responses for row in (resp.data or []) if row.get("id")}
+    if len(ids) < len(names):
+        raise RuntimeError("Failed to create customer record")
+    return ids
+
+
+async def _fetch_customers_metadata(supabase: AClient, external_refs: Sequence[str]):
+    return await (
         supabase
         .table(CUSTOMERS_TABLE)
         .select("id, external_ref, action_taken, slack_updated, follow_up, escalation")
-        .in_("external_ref", list(external_refs))
+        .in_("external_ref", external_refs)
         .execute()
     )
 
 
-async def fetch_customers_metadata(supabase: Client, external_refs: Sequence[str]) -> Dict[str, Dict[str, Any]]:
-    if not external_refs:
+async def fetch_customers_metadata(supabase: AClient, external_refs: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    # dedupe (order-preserving) so the in.(...) filter stays as short as possible
+    refs = list(dict.fromkeys(external_refs))
+    if not refs:
         return {}
-    resp = await asyncio.to_thread(_fetch_customers_metadata_sync, supabase, external_refs)
-    rows = resp.data or []
-    return {row["external_ref"]: row for row in rows if row.get("external_ref")}
+    batches = [refs[start:start + METADATA_BATCH_SIZE] for start in range(0, len(refs), METADATA_BATCH_SIZE)]
+    responses = await asyncio.gather(
+        *(_fetch_customers_metadata(supabase, batch) for batch in batches)
+    )
+    # external_ref is the filter key, so every returned row carries it
+    return {row["external_ref"]: row for resp in responses for row in (resp.data or [])}
 
 
 async def update_customer_status(
-    supabase: Client,
+    supabase: AClient,
     *,
     customer_id: Optional[str] = None,
     external_ref: Optional[str] = None,
@@ -167,26 +176,33 @@ async def update_customer_status(
     if not updates:
         return
     if customer_id:
-        await asyncio.to_thread(_update_customer_sync, supabase, customer_id, updates)
+        await _update_customer(supabase, customer_id, updates)
     elif external_ref:
         # ensure a customer row exists so UI-only updates work without a sync pass
         ensured_name = customer_name or external_ref
         ensured_id = await get_or_create_customer_id(supabase, external_ref, ensured_name)
-        await asyncio.to_thread(_update_customer_sync, supabase, ensured_id, updates)
+        await _update_customer(supabase, ensured_id, updates)
     else:
         raise ValueError("customer_id or external_ref is required to update customer status")
 
 
-def _insert_invoice_sync(supabase: Client, payload: Dict[str, Any]):
-    return supabase.table(INVOICES_TABLE).insert(payload).execute()
+async def _insert_invoices(supabase: AClient, payloads: Sequence[Dict[str, Any]]):
+    # PostgREST accepts a JSON array and inserts every row in one request
+    return await supabase.table(INVOICES_TABLE).insert(list(payloads)).execute()
+
+
+async def insert_invoices(supabase: AClient, payloads: Sequence[Dict[str, Any]]) -> None:
+    if not payloads:
+        return
+    await _insert_invoices(supabase, payloads)
 
 
-async def insert_invoice(supabase: Client, payload: Dict[str, Any]) -> None:
-    await asyncio.to_thread(_insert_invoice_sync, supabase, payload)
+async def insert_invoice(supabase: AClient, payload: Dict[str, Any]) -> None:
+    await insert_invoices(supabase, [payload])
 
 
-def _list_invoices_sync(supabase: Client, limit: int):
-    return (
+async def _list_invoices(supabase: AClient, limit: int):
+    return await (
         supabase
         .table(INVOICES_TABLE)
         .select("*")
@@ -196,8 +212,8 @@ def _list_invoices_sync(supabase: Client, limit: int):
     )
 
 
-async def list_invoices(supabase: Client, limit: int = 1000) -> list[Dict[str, Any]]:
-    resp = await asyncio.to_thread(_list_invoices_sync, supabase, limit)
+async def list_invoices(supabase: AClient, limit: int = 1000) -> list[Dict[str, Any]]:
+    resp = await _list_invoices(supabase, limit)
     return resp.data or []
 
 
@@ -205,7 +221,9 @@ __all__ = [
     "fetch_connection",
     "upsert_connection",
     "get_or_create_customer_id",
+    "bulk_get_or_create_customers",
     "insert_invoice",
+    "insert_invoices",
     "list_invoices",
     "fetch_customers_metadata",
     "update_customer_status",
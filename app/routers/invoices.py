@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 
-from ..schemas import InvoiceRead
+from ..schemas import INVOICE_READ_LIST, InvoiceRead
 from ..auth import get_current_user
 from ..qbo_store import list_invoices
 from . import deps
@@ -13,4 +13,4 @@ async def list_invoices_route(
     user=Depends(get_current_user),
 ):
     records = await list_invoices(supabase)
-    return [InvoiceRead.model_validate(rec) for rec in records]
+    return INVOICE_READ_LIST.validate_python(records)
@@ -1,14 +1,21 @@
 # app/routers/quickbooks.py
-import secrets
+import asyncio
+import hashlib
+import time
+from collections import defaultdict
+from contextlib import aclosing
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Callable, Optional, Dict, Any, Union
+from urllib.parse import urlencode
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import RedirectResponse, JSONResponse
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response, StreamingResponse
 
 from ..config import settings
 from ..aging import simplify_ar_aging
+from ..http_clients import QBO_API_BASE, qbo_api_client, qbo_token_client
 from ..qbo_store import (
     fetch_connection,
     fetch_customers_metadata,
@@ -16,81 +23,146 @@ from ..qbo_store import (
     upsert_connection,
 )
 from ..schemas import CustomerStatusUpdate
+from ..state_store import get_state_store
 from . import deps
 
 AUTH_BASE = "https://appcenter.intuit.com/connect/oauth2"
 TOKEN_URL = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
 
+# query bodies are sent as-is; keeping them as bytes skips the per-request str -> bytes encode
+_COMPANY_INFO_SQL = b"select * from CompanyInfo"
+_LATEST_INVOICES_SQL = (
+    b"select Id, TotalAmt, Balance, TxnDate, DueDate, CustomerRef "
+    b"from Invoice order by MetaData.CreateTime desc maxresults 25"
+)
+
 router = APIRouter(tags=["quickbooks"])
 
-# super simple ephemeral state/CSRF storage (replace with a real cache/session)
-class StateStore:
-    _mem: Dict[str, Dict[str, Optional[str]]] = {}
-    @classmethod
-    def issue(cls, user_id: str, return_url: Optional[str] = None) -> str:
-        state = secrets.token_urlsafe(24)
-        cls._mem[state] = {"user_id": user_id, "return_url": return_url}
-        return state
-    @classmethod
-    def consume(cls, state: str) -> Optional[Dict[str, Optional[str]]]:
-        data = cls._mem.pop(state, None)
-        if not data:
-            return None
-        return data
+# access tokens live ~1h; serve them from memory until 5 minutes before expiry
+TOKEN_EXPIRY_BUFFER = 300.0
+# user_id -> (connection record, token expiry on the time.monotonic() clock)
+_TOKEN_CACHE: Dict[str, tuple[Dict[str, Any], float]] = {}
+# one refresh per user at a time; Intuit rotates refresh tokens, so racing refreshes can
+# invalidate each other
+_TOKEN_LOCKS: "defaultdict[str, asyncio.Lock]" = defaultdict(asyncio.Lock)
+
+# dashboards re-request the same aging view many times a minute; keep recent reports briefly
+AR_CACHE_MAXSIZE = 1_000
+# reports above this size are served but not kept
+AR_CACHE_MAX_BYTES = 4 * 1024 * 1024
+# all cached reports together stay under this many (encoded) bytes
+AR_CACHE_MAX_TOTAL_BYTES = 64 * 1024 * 1024
+# cache key -> (expiry on the time.monotonic() clock, payload, encoded size); insertion order
+# drives FIFO eviction
+_AR_CACHE: Dict[str, tuple[float, Any, int]] = {}
+_AR_CACHE_BYTES = 0
 
 def api_base() -> str:
-    return "https://quickbooks.api.intuit.com"
+    return QBO_API_BASE
 
 # ---------------------- OAuth helpers ------------------------------
+_SCOPE = "com.intuit.quickbooks.accounting"
+# everything but the state is fixed for the process, so encode it once
+_AUTH_QUERY = urlencode({
+    "client_id": settings.QBO_CLIENT_ID,
+    "response_type": "code",
+    "scope": _SCOPE,
+    "redirect_uri": settings.QBO_REDIRECT_URL,
+})
+
 def auth_url(state: str) -> str:
-    scope = "com.intuit.quickbooks.accounting"
-    from urllib.parse import urlencode
-    qs = urlencode({
-        "client_id": settings.QBO_CLIENT_ID,
-        "response_type": "code",
-        "scope": scope,
-        "redirect_uri": settings.QBO_REDIRECT_URL,
-        "state": state
-    })
-    return f"{AUTH_BASE}?{qs}"
+    return f"{AUTH_BASE}?{_AUTH_QUERY}&{urlencode({'state': state})}"
 
 async def exchange_code_for_tokens(code: str) -> Dict[str, Any]:
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(
-            TOKEN_URL,
-            data={
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": settings.QBO_REDIRECT_URL,
-            },
-            auth=(settings.QBO_CLIENT_ID, settings.QBO_CLIENT_SECRET),
-            headers={"Accept": "application/json", "Content-Type": "application/x-www-form-urlencoded"},
-        )
-        r.raise_for_status()
-        return r.json()
+    r = await qbo_token_client().post(
+        TOKEN_URL,
+        data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": settings.QBO_REDIRECT_URL,
+        },
+        auth=(settings.QBO_CLIENT_ID, settings.QBO_CLIENT_SECRET),
+        headers={"Accept": "application/json", "Content-Type": "application/x-www-form-urlencoded"},
+    )
+    r.raise_for_status()
+    return r.json()
+
+def _cached_token(user_id: str) -> Optional[Dict[str, Any]]:
+    entry = _TOKEN_CACHE.get(user_id)
+    if entry and entry[1] > time.monotonic() + TOKEN_EXPIRY_BUFFER:
+        return entry[0]
+    return None
+
+def _remember_token(user_id: str, rec: Dict[str, Any]) -> None:
+    expires_at = rec.get("expires_at")
+    if not isinstance(expires_at, datetime):
+        return
+    # convert to the monotonic clock once so NTP/DST jumps can't stretch the cache lifetime
+    remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+    _TOKEN_CACHE[user_id] = (rec, time.monotonic() + remaining)
+
+def evict_cached_token(user_id: str, access_token: Optional[str] = None) -> None:
+    """
+    Forget the in-memory token for a user, e.g. after QBO rejected it with a 401.
 
-async def refresh_if_needed(user_id: str, supabase) -> Dict[str, Any]:
-    rec = await fetch_connection(supabase, user_id)
+    With ``access_token``, only evict if that is still the cached token, so a request holding
+    a stale token can't throw away one that a concurrent forced refresh just stored.
+    """
+    entry = _TOKEN_CACHE.get(user_id)
+    if entry and (access_token is None or entry[0].get("access_token") == access_token):
+        del _TOKEN_CACHE[user_id]
+        # drop the user's lock with the token so _TOKEN_LOCKS doesn't grow with every user
+        # ever seen; a held or awaited lock stays, or a second refresh could start beside it
+        lock = _TOKEN_LOCKS.get(user_id)
+        if lock is not None and not lock.locked() and not getattr(lock, "_waiters", None):
+            del _TOKEN_LOCKS[user_id]
+
+async def refresh_if_needed(user_id: str, supabase, force: bool = False) -> Dict[str, Any]:
+    """
+    Return a usable connection record for the user, refreshing the access token when needed.
+
+    ``force`` is for tokens QBO has already rejected: it skips the in-memory and connection
+    caches and always exchanges the refresh token. Evict the rejected token first; anything
+    cached by the time the lock is acquired came from a newer refresh and is used as-is.
+    """
+    rec = None if force else _cached_token(user_id)
+    if rec is not None:
+        return rec
+    async with _TOKEN_LOCKS[user_id]:
+        # another request may have refreshed while we waited for the lock
+        rec = _cached_token(user_id)
+        if rec is not None:
+            return rec
+        rec = await _load_or_refresh_token(user_id, supabase, force=force)
+        # built once per token and cached with it; set after the upsert so it never reaches
+        # the connections table
+        rec["_auth_header"] = {"Authorization": f"Bearer {rec['access_token']}", "Accept": "application/json"}
+        _remember_token(user_id, rec)
+        return rec
+
+async def _load_or_refresh_token(user_id: str, supabase, force: bool = False) -> Dict[str, Any]:
+    rec = await fetch_connection(supabase, user_id, use_cache=not force)
     if not rec:
         raise RuntimeError("QuickBooks is not connected for this user")
 
     now = datetime.now(timezone.utc)
     expires_at = rec.get("expires_at")
-    if expires_at and expires_at > now + timedelta(seconds=60):
+    # same margin as _cached_token, or a token inside the buffer would be returned here but
+    # never served from memory, sending every request back through the lock
+    if not force and expires_at and expires_at > now + timedelta(seconds=TOKEN_EXPIRY_BUFFER):
         return rec
 
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(
-            TOKEN_URL,
-            data={
-                "grant_type": "refresh_token",
-                "refresh_token": rec["refresh_token"],
-            },
-            auth=(settings.QBO_CLIENT_ID, settings.QBO_CLIENT_SECRET),
-            headers={"Accept": "application/json", "Content-Type": "application/x-www-form-urlencoded"},
-        )
-        r.raise_for_status()
-        tok = r.json()
+    r = await qbo_token_client().post(
+        TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": rec["refresh_token"],
+        },
+        auth=(settings.QBO_CLIENT_ID, settings.QBO_CLIENT_SECRET),
+        headers={"Accept": "application/json", "Content-Type": "application/x-www-form-urlencoded"},
+    )
+    r.raise_for_status()
+    tok = r.json()
 
     rec.update({
         "access_token": tok["access_token"],
@@ -101,35 +173,157 @@ async def refresh_if_needed(user_id: str, supabase) -> Dict[str, Any]:
     return rec
 
 # ---------------------- QBO Query helper ---------------------------
-async def qbo_query(user_id: str, supabase, sql: str, minorversion: str = "73") -> Dict[str, Any]:
+async def _send_authorized(
+    user_id: str,
+    supabase,
+    build: Callable[[Dict[str, Any]], httpx.Request],
+    *,
+    stream: bool = False,
+) -> httpx.Response:
+    """
+    Send a QBO API request built for the user's current token.
+
+    QBO can revoke a token well before ``expires_at`` (app disconnected, password reset); a
+    401 evicts it, forces one refresh and retries once instead of failing until expiry.
+    """
+    client = qbo_api_client()
     rec = await refresh_if_needed(user_id, supabase)
-    url = f"{api_base()}/v3/company/{rec['realm_id']}/query"
-    headers = {
-        "Authorization": f"Bearer {rec['access_token']}",
-        "Accept": "application/json",
-        "Content-Type": "text/plain",
-    }
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(url, params={"minorversion": minorversion}, headers=headers, content=sql)
+    r = await client.send(build(rec), stream=stream)
+    if r.status_code == 401:
+        if stream:
+            await r.aclose()
+        evict_cached_token(user_id, rec["access_token"])
+        rec = await refresh_if_needed(user_id, supabase, force=True)
+        r = await client.send(build(rec), stream=stream)
+    if r.is_error:
+        if stream:
+            await r.aread()  # keep the body for the error detail
+            await r.aclose()
+        if r.status_code == 401:
+            evict_cached_token(user_id, rec["access_token"])
         r.raise_for_status()
-        return r.json()
+    return r
+
+
+async def qbo_query(user_id: str, supabase, sql: Union[bytes, str], minorversion: str = "73") -> Dict[str, Any]:
+    def build(rec: Dict[str, Any]) -> httpx.Request:
+        return qbo_api_client().build_request(
+            "POST",
+            f"/v3/company/{rec['realm_id']}/query",
+            params={"minorversion": minorversion},
+            headers=rec["_auth_header"] | {"Content-Type": "text/plain"},
+            content=sql,
+        )
+
+    r = await _send_authorized(user_id, supabase, build)
+    return orjson.loads(r.content)
+
+
+def _report_request(rec: Dict[str, Any], report: str, params: Optional[Dict[str, Any]], minorversion: str) -> httpx.Request:
+    return qbo_api_client().build_request(
+        "GET",
+        f"/v3/company/{rec['realm_id']}/reports/{report}",
+        params={"minorversion": minorversion, **(params or {})},
+        headers=rec["_auth_header"],
+    )
 
 
 async def qbo_report(user_id: str, supabase, report: str, params: Optional[Dict[str, Any]] = None, minorversion: str = "73") -> Dict[str, Any]:
-    rec = await refresh_if_needed(user_id, supabase)
-    url = f"{api_base()}/v3/company/{rec['realm_id']}/reports/{report}"
-    headers = {
-        "Authorization": f"Bearer {rec['access_token']}",
-        "Accept": "application/json",
-    }
-    query_params: Dict[str, Any] = {"minorversion": minorversion}
-    if params:
-        query_params.update(params)
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url, params=query_params, headers=headers)
-        r.raise_for_status()
-        return r.json()
+    r = await _send_authorized(user_id, supabase, lambda rec: _report_request(rec, report, params, minorversion))
+    return orjson.loads(r.content)
+
+
+async def qbo_report_stream(user_id: str, supabase, report: str, params: Optional[Dict[str, Any]] = None, minorversion: str = "73") -> AsyncIterator[bytes]:
+    """
+    Open a report request and return its body as chunks, without parsing it.
+
+    The status is checked before returning, so errors still surface as HTTPStatusError
+    rather than half-way through a streamed 200.
+    """
+    r = await _send_authorized(
+        user_id, supabase, lambda rec: _report_request(rec, report, params, minorversion), stream=True
+    )
+
+    async def chunks() -> AsyncIterator[bytes]:
+        try:
+            # decoded bytes, not aiter_raw: httpx negotiates gzip and we don't forward Content-Encoding
+            async for chunk in r.aiter_bytes(65536):
+                yield chunk
+        finally:
+            await r.aclose()
+
+    return chunks()
+
+
+async def _stream_into_cache(cache_key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # keep a copy of small reports for the cache; only a fully sent body is stored
+    parts: Optional[list[bytes]] = []
+    size = 0
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            yield chunk
+            if parts is not None:
+                parts.append(chunk)
+                size += len(chunk)
+                if size > AR_CACHE_MAX_BYTES:
+                    parts = None
+    if parts is not None:
+        body = b"".join(parts)
+        _ar_cache_put(cache_key, (body, _etag(body)), len(body))
+
+
+def _etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def _json_with_etag(
+    request: Request, body: bytes, etag: Optional[str] = None, cache_control: str = "private, max-age=30"
+) -> Response:
+    """Serve an encoded JSON body with a weak ETag, or a bodiless 304 if the client has it."""
+    etag = etag or _etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in {tag.strip() for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _ar_cache_key(user_id: str, view: str, params: Dict[str, Any]) -> str:
+    # the plain user_id prefix lets evict_cached_reports find a user's entries
+    query = urlencode(sorted(params.items()))
+    return f"{user_id}|" + hashlib.sha256(f"{view}|{query}".encode()).hexdigest()
+
+def _ar_cache_drop(key: str) -> None:
+    global _AR_CACHE_BYTES
+    entry = _AR_CACHE.pop(key, None)
+    if entry is not None:
+        _AR_CACHE_BYTES -= entry[2]
+
+def _ar_cache_get(key: str) -> Optional[Any]:
+    entry = _AR_CACHE.get(key)
+    if entry is None:
+        return None
+    expires_at, payload, _ = entry
+    if expires_at <= time.monotonic():
+        _ar_cache_drop(key)
+        return None
+    return payload
+
+def evict_cached_reports(user_id: str) -> None:
+    """Forget every cached A/R report for a user, e.g. after they connect another company."""
+    prefix = f"{user_id}|"
+    for key in [k for k in _AR_CACHE if k.startswith(prefix)]:
+        _ar_cache_drop(key)
+
+def _ar_cache_put(key: str, payload: Any, nbytes: int) -> None:
+    global _AR_CACHE_BYTES
+    # re-insert at the end so eviction order follows insertion time
+    _ar_cache_drop(key)
+    if nbytes > AR_CACHE_MAX_BYTES:
+        return
+    _AR_CACHE[key] = (time.monotonic() + settings.AR_REPORT_CACHE_TTL_SECONDS, payload, nbytes)
+    _AR_CACHE_BYTES += nbytes
+    while len(_AR_CACHE) > AR_CACHE_MAXSIZE or _AR_CACHE_BYTES > AR_CACHE_MAX_TOTAL_BYTES:
+        _ar_cache_drop(next(iter(_AR_CACHE)))
 
 
 # ---------------------- FastAPI routes ------------------------------
@@ -143,10 +337,10 @@ async def qbo_login(
     """
     Starts the Intuit OAuth flow. Generates a per-user state token and redirects to Intuit.
     """
-    state = StateStore.issue(user_id, return_to)
+    state = await get_state_store().issue(user_id, return_to)
     url = auth_url(state)
     if return_url:
-        return JSONResponse({"redirect_url": url, "state": state})
+        return ORJSONResponse({"redirect_url": url, "state": state})
     return RedirectResponse(url=url)
 
 
@@ -160,7 +354,7 @@ async def qbo_callback(
     """
     Handles Intuit redirect. Exchanges the auth code for tokens and stores them.
     """
-    state_data = StateStore.consume(state)
+    state_data = await get_state_store().consume(state)
     if not state_data or not state_data.get("user_id"):
         raise HTTPException(status_code=400, detail="Invalid or expired state")
     user_id = state_data["user_id"]
@@ -183,10 +377,11 @@ async def qbo_callback(
             "expires_at": expires_at,
         },
     )
+    # a reconnect may point at a different company; don't keep serving the old token or reports
+    evict_cached_token(user_id)
+    evict_cached_reports(user_id)
 
     if return_to:
-        from urllib.parse import urlencode
-
         query = urlencode({
             "ok": "true",
             "message": "Connected to QuickBooks",
@@ -195,10 +390,10 @@ async def qbo_callback(
         redirect_url = f"{return_to}?{query}"
         return RedirectResponse(url=redirect_url, status_code=303)
 
-    return JSONResponse({"ok": True, "message": "Connected to QuickBooks", "realmId": realmId})
+    return ORJSONResponse({"ok": True, "message": "Connected to QuickBooks", "realmId": realmId})
 
 
-@router.get("/qbo/company")
+@router.get("/qbo/company", response_model=None)
 async def qbo_company_info(
     user_id: str = Depends(deps.get_user_id),
     supabase=Depends(deps.get_supabase),
@@ -207,15 +402,15 @@ async def qbo_company_info(
     Test endpoint: returns CompanyInfo from QBO to verify the connection.
     """
     try:
-        payload = await qbo_query(user_id, supabase, "select * from CompanyInfo")
+        payload = await qbo_query(user_id, supabase, _COMPANY_INFO_SQL)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return payload
+    return ORJSONResponse(payload)
 
 
-@router.get("/qbo/invoices/latest")
+@router.get("/qbo/invoices/latest", response_model=None)
 async def qbo_latest_invoices(
     user_id: str = Depends(deps.get_user_id),
     supabase=Depends(deps.get_supabase),
@@ -223,21 +418,18 @@ async def qbo_latest_invoices(
     """
     Returns the latest invoices for the authenticated user/company.
     """
-    sql = (
-        "select Id, TotalAmt, Balance, TxnDate, DueDate, CustomerRef "
-        "from Invoice order by MetaData.CreateTime desc maxresults 25"
-    )
     try:
-        payload = await qbo_query(user_id, supabase, sql)
+        payload = await qbo_query(user_id, supabase, _LATEST_INVOICES_SQL)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return JSONResponse(payload)
+    return ORJSONResponse(payload)
 
 
-@router.get("/qbo/reports/ar-aging-detail")
+@router.get("/qbo/reports/ar-aging-detail", response_model=None)
 async def qbo_ar_aging_detail(
+    request: Request,
     user_id: str = Depends(deps.get_user_id),
     supabase=Depends(deps.get_supabase),
     report_date: Optional[str] = Query(None, description="YYYY-MM-DD date for the report."),
@@ -248,6 +440,7 @@ async def qbo_ar_aging_detail(
         None,
         description="Comma-separated list of columns to include. See QBO docs for allowed values.",
     ),
+    refresh: bool = Query(False, description="Bypass the short-lived report cache and fetch from QuickBooks."),
 ):
     """
     Fetches the QuickBooks A/R Aging Detail report for the connected company.
@@ -264,17 +457,27 @@ async def qbo_ar_aging_detail(
     if columns:
         params["columns"] = columns
 
+    # the report is passed through untouched, so relay QBO's bytes instead of parsing and
+    # re-encoding them
+    cache_key = _ar_cache_key(user_id, "detail", params)
+    cached = None if refresh else _ar_cache_get(cache_key)
+    if cached is not None:
+        body, etag = cached
+        return _json_with_etag(request, body, etag)
+    # a streamed body can't carry an ETag (headers go out before the hash is known); once
+    # cached, repeat requests within the TTL get one and can revalidate to a 304
     try:
-        payload = await qbo_report(user_id, supabase, "AgedReceivableDetail", params=params)
+        chunks = await qbo_report_stream(user_id, supabase, "AgedReceivableDetail", params=params)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return JSONResponse(payload)
+    return StreamingResponse(_stream_into_cache(cache_key, chunks), media_type="application/json")
 
 
-@router.get("/qbo/reports/ar-aging-detail/simplified")
+@router.get("/qbo/reports/ar-aging-detail/simplified", response_model=None)
 async def qbo_ar_aging_detail_simplified(
+    request: Request,
     user_id: str = Depends(deps.get_user_id),
     supabase=Depends(deps.get_supabase),
     report_date: Optional[str] = Query(None, description="YYYY-MM-DD date for the report."),
@@ -289,6 +492,7 @@ async def qbo_ar_aging_detail_simplified(
         False,
         description="Group QuickBooks jobs by their parent customer and report them in the oldest bucket only.",
     ),
+    refresh: bool = Query(False, description="Bypass the short-lived report cache and fetch from QuickBooks."),
 ):
     """
     Returns a policy-aware collections summary derived from the QBO aging detail report.
@@ -305,12 +509,20 @@ async def qbo_ar_aging_detail_simplified(
     if columns:
         params["columns"] = columns
 
+    cache_key = _ar_cache_key(user_id, "simplified", {**params, "aggregate_customers": aggregate_customers})
+    summary = None if refresh else _ar_cache_get(cache_key)
     try:
-        raw = await qbo_report(user_id, supabase, "AgedReceivableDetail", params=params)
-        summary = simplify_ar_aging(raw, aggregate_customers=aggregate_customers)
-        external_refs = [row.get("external_ref") for row in summary["rows"] if row.get("external_ref")]
+        if summary is None:
+            raw = await qbo_report(user_id, supabase, "AgedReceivableDetail", params=params)
+            summary = simplify_ar_aging(raw, aggregate_customers=aggregate_customers)
+            # sized by its JSON encoding, the same measure the raw detail reports use
+            _ar_cache_put(cache_key, summary, len(orjson.dumps(summary)))
+        # customer status is read fresh on every call (PATCHes show up at once), so annotate
+        # copies and leave the cached rows untouched
+        rows = [dict(row) for row in summary["rows"]]
+        external_refs = [row.get("external_ref") for row in rows if row.get("external_ref")]
         metadata = await fetch_customers_metadata(supabase, external_refs)
-        for row in summary["rows"]:
+        for row in rows:
             meta = metadata.get(row.get("external_ref")) if row.get("external_ref") else None
             row["customer_id"] = meta.get("id") if meta else None
             row["action_taken"] = meta.get("action_taken") if meta else None
@@ -321,10 +533,13 @@ async def qbo_ar_aging_detail_simplified(
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
     except RuntimeError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return JSONResponse(summary)
+    # encode once: the same bytes are hashed for the ETag and sent as the body. no-cache, not
+    # max-age: rows carry customer status, so the browser must revalidate (a cheap 304) each
+    # time or a PATCHed status would stay hidden behind its local copy
+    return _json_with_etag(request, orjson.dumps({**summary, "rows": rows}), cache_control="private, no-cache")
 
 
-@router.patch("/qbo/customers/status")
+@router.patch("/qbo/customers/status", response_model=None)
 async def qbo_update_customer_status(
     payload: CustomerStatusUpdate,
     supabase=Depends(deps.get_supabase),
@@ -352,4 +567,4 @@ async def qbo_update_customer_status(
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-    return JSONResponse({"ok": True})
+    return ORJSONResponse({"ok": True})
@@ -1,61 +1,67 @@
-from datetime import date
+import re
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException
 
 from ..auth import get_current_user
-from ..qbo_store import get_or_create_customer_id, insert_invoice
+from ..qbo_store import bulk_get_or_create_customers, insert_invoices
 from ..routers import deps
-from ..routers.quickbooks import api_base, refresh_if_needed
+from ..routers.quickbooks import qbo_query
 
 router = APIRouter(prefix="/api/v1/quickbooks", tags=["quickbooks"])
 
+# rows per bulk insert; keeps each PostgREST request comfortably under its body-size limit
+INSERT_BATCH_SIZE = 500
+# invoices are plain inserts (no QBO Id stored to upsert on), so a sync stays limited to the
+# latest 200; widening it would only multiply duplicate rows
+INVOICE_SYNC_SQL = (
+    b"select Id, TotalAmt, Balance, TxnDate, DueDate, CustomerRef from Invoice "
+    b"order by MetaData.CreateTime desc maxresults 200"
+)
+# QBO already sends YYYY-MM-DD, which is what Postgres takes; check the shape and pass it through
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _iso_date(v: str | None) -> str | None:
+    if not v:
+        return None
+    if _ISO_DATE_RE.fullmatch(v) is None:
+        raise HTTPException(status_code=400, detail=f"Invoice has an invalid date: {v!r}")
+    return v
+
+
+def _invoice_row(inv: dict, customer_id: str) -> dict:
+    balance = float(inv.get("Balance") or 0)
+    return {
+        "customer_id": customer_id,
+        "invoice_date": _iso_date(inv.get("TxnDate")),
+        "due_date": _iso_date(inv.get("DueDate")),
+        "amount": float(inv.get("TotalAmt") or 0),
+        "open_balance": balance,
+        "status": "OPEN" if balance > 0 else "PAID",
+    }
+
 
 @router.post("/sync")
 async def sync_quickbooks(
     supabase=Depends(deps.get_supabase),
     user=Depends(get_current_user),
 ):
-    qb = await refresh_if_needed(user["sub"], supabase)
-    headers = {
-        "Authorization": f"Bearer {qb['access_token']}",
-        "Accept": "application/json",
-        "Content-Type": "application/text",
-    }
-    query_url = f"{api_base()}/v3/company/{qb['realm_id']}/query"
-    sql = "select Id, TotalAmt, Balance, TxnDate, DueDate, CustomerRef from Invoice order by MetaData.CreateTime desc maxresults 200"
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(
-            query_url,
-            params={"minorversion": "73"},
-            headers=headers,
-            content=sql,
-        )
-        r.raise_for_status()
-        data = r.json()
-
+    data = await qbo_query(user["sub"], supabase, INVOICE_SYNC_SQL)
     items = (data.get("QueryResponse", {}) or {}).get("Invoice", []) or []
 
-    def to_date(v: str | None) -> str | None:
-        return date.fromisoformat(v).isoformat() if v else None
-
+    customers: dict[str, str] = {}
     for inv in items:
         cust_ref = inv.get("CustomerRef", {}) or {}
         cust_id = cust_ref.get("value")
         if not cust_id:
             raise HTTPException(status_code=400, detail="Invoice missing customer reference")
-        cust_name = cust_ref.get("name") or "Unknown"
-        customer_id = await get_or_create_customer_id(supabase, cust_id, cust_name)
-
-        row = {
-            "customer_id": customer_id,
-            "invoice_date": to_date(inv.get("TxnDate")),
-            "due_date": to_date(inv.get("DueDate")),
-            "amount": float(inv.get("TotalAmt") or 0),
-            "open_balance": float(inv.get("Balance") or 0),
-            "status": "OPEN" if float(inv.get("Balance") or 0) > 0 else "PAID",
-        }
-        await insert_invoice(supabase, row)
+        customers.setdefault(cust_id, cust_ref.get("name") or "Unknown")
+    # one round-trip for every customer in the sync instead of one per invoice
+    customer_ids = await bulk_get_or_create_customers(supabase, customers.items())
+
+    rows = [_invoice_row(inv, customer_ids[inv["CustomerRef"]["value"]]) for inv in items]
+
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        await insert_invoices(supabase, rows[start:start + INSERT_BATCH_SIZE])
 
     return {"ok": True, "imported": len(items)}
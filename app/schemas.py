@@ -1,4 +1,5 @@
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, ConfigDict, TypeAdapter, model_validator
+from pydantic_core import PydanticCustomError
 from datetime import date
 from typing import Optional
 from uuid import UUID
@@ -12,9 +13,13 @@ class InvoiceCreate(BaseModel):
     status: Optional[str] = "OPEN"
 
 class InvoiceRead(InvoiceCreate):
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
     id: UUID
-    class Config:
-        from_attributes = True
+
+
+# validates a whole result set in one pydantic-core call instead of one model_validate per row
+INVOICE_READ_LIST = TypeAdapter(list[InvoiceRead])
 
 
 class CustomerStatusUpdate(BaseModel):
@@ -27,7 +32,7 @@ class CustomerStatusUpdate(BaseModel):
     escalation: Optional[bool] = None
 
     @model_validator(mode="after")
-    def _validate_identifier(cls, model: "CustomerStatusUpdate"):
-        if not model.customer_id and not model.external_ref:
-            raise ValueError("customer_id or external_ref is required")
-        return model
+    def _validate_identifier(self) -> "CustomerStatusUpdate":
+        if not self.customer_id and not self.external_ref:
+            raise PydanticCustomError("identifier_required", "customer_id or external_ref is required")
+        return self
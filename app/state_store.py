@@ -0,0 +1,99 @@
+# app/state_store.py
+"""Short-lived OAuth state/CSRF tokens, shared across workers when Redis is configured."""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+import orjson
+
+from .config import settings
+
+STATE_TTL_SECONDS = 600
+STATE_NBYTES = 16  # 128 bits of entropy (22 url-safe chars) is plenty for a 10-minute CSRF token
+StateData = Dict[str, Optional[str]]
+
+
+class MemoryStateStore:
+    """Per-process store bounded by age and size; used when REDIS_URL is unset (dev)."""
+
+    MAX_ENTRIES = 10_000
+
+    def __init__(self) -> None:
+        # state -> (data, expiry on the time.monotonic() clock); insertion order == expiry order
+        self._mem: "OrderedDict[str, tuple[StateData, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        # abandoned OAuth flows never consume their state; drop them from the old end
+        while self._mem:
+            _, expires_at = next(iter(self._mem.values()))
+            if expires_at >= now and len(self._mem) < self.MAX_ENTRIES:
+                break
+            self._mem.popitem(last=False)
+
+    async def issue(self, user_id: str, return_url: Optional[str] = None) -> str:
+        state = secrets.token_urlsafe(STATE_NBYTES)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._mem[state] = ({"user_id": user_id, "return_url": return_url}, now + STATE_TTL_SECONDS)
+        return state
+
+    async def consume(self, state: str) -> Optional[StateData]:
+        with self._lock:
+            data, expires_at = self._mem.pop(state, (None, 0.0))
+        if not data or expires_at < time.monotonic():
+            return None
+        return data
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisStateStore:
+    """Redis-backed store, so the Intuit callback can land on any worker."""
+
+    KEY_PREFIX = "qbo:oauth-state:"
+
+    def __init__(self, url: str) -> None:
+        from redis.asyncio import Redis  # only needed when REDIS_URL is configured
+
+        self._redis = Redis.from_url(url, decode_responses=True)
+
+    async def issue(self, user_id: str, return_url: Optional[str] = None) -> str:
+        state = secrets.token_urlsafe(STATE_NBYTES)
+        value = orjson.dumps({"user_id": user_id, "return_url": return_url})
+        await self._redis.set(self.KEY_PREFIX + state, value, ex=STATE_TTL_SECONDS, nx=True)
+        return state
+
+    async def consume(self, state: str) -> Optional[StateData]:
+        # GETDEL is atomic, so a replayed callback can't consume the same state twice
+        raw = await self._redis.getdel(self.KEY_PREFIX + state)
+        return orjson.loads(raw) if raw else None
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+_STORE: Optional[Union[MemoryStateStore, RedisStateStore]] = None
+
+
+def get_state_store() -> Union[MemoryStateStore, RedisStateStore]:
+    """Return the process-wide state store, creating it on first use."""
+    global _STORE
+    if _STORE is None:
+        _STORE = RedisStateStore(settings.REDIS_URL) if settings.REDIS_URL else MemoryStateStore()
+    return _STORE
+
+
+async def aclose_state_store() -> None:
+    global _STORE
+    if _STORE is not None:
+        await _STORE.aclose()
+        _STORE = None
+
+
+__all__ = ["get_state_store", "aclose_state_store", "MemoryStateStore", "RedisStateStore"]
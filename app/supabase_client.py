@@ -1,22 +1,39 @@
 # app/supabase_client.py
 """Shared Supabase client for the backend."""
 
-from functools import lru_cache
+import threading
 from typing import Optional
 
-from supabase import Client, create_client
+from supabase import AClient
 
 from .config import settings
 
+_CLIENT: Optional[AClient] = None
+# get_supabase is a sync dependency, so first calls can race on threadpool threads
+_LOCK = threading.Lock()
 
-@lru_cache(maxsize=1)
-def get_supabase_client() -> Client:
-    """Return a cached Supabase client instance."""
-    url = settings.SUPABASE_URL
-    key: Optional[str] = settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
-    if not url or not key:
-        raise RuntimeError("Supabase credentials are not configured")
-    return create_client(url, key)
 
+def get_supabase_client() -> AClient:
+    """Return the shared async Supabase client instance (its PostgREST session is pooled)."""
+    global _CLIENT
+    if _CLIENT is not None:
+        return _CLIENT
+    with _LOCK:
+        if _CLIENT is None:
+            url = settings.SUPABASE_URL
+            key: Optional[str] = settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
+            if not url or not key:
+                raise RuntimeError("Supabase credentials are not configured")
+            _CLIENT = AClient(url, key)
+    return _CLIENT
 
-__all__ = ["get_supabase_client"]
+
+async def aclose_supabase_client() -> None:
+    """Close the pooled PostgREST connections if the client was ever created."""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.postgrest.aclose()
+        _CLIENT = None
+
+
+__all__ = ["get_supabase_client", "aclose_supabase_client"]